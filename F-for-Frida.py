@@ -1,12 +1,13 @@
+import hashlib
+import lzma
 import os
+import re
+import shlex
 import subprocess
-import sys
-import requests
 import time
-from tqdm import tqdm
+from concurrent.futures import ThreadPoolExecutor
 import logging
 from colorama import Fore, Style, init
-from shutil import which
 
 # Initialize colorama
 init(autoreset=True)
@@ -16,46 +17,87 @@ logging.basicConfig(filename='frida_script.log', level=logging.INFO, format='%(a
 
 FRIDA_PORT = 27042
 
-# Check if 'xz' is installed on the system
-def check_xz_installed():
-    if which("xz") is None:
-        print(Fore.RED + "[-] Error: 'xz' command is not installed on your system. Please install it to continue.")
-        sys.exit(1)
+# Accepted Frida release versions (e.g. 16.1.17); anything else never reaches a URL or device shell
+FRIDA_VERSION_RE = re.compile(r"[0-9]+\.[0-9]+\.[0-9]+")
+
+# GitHub API description of a Frida release; its assets carry the published "sha256:<hex>" digests
+FRIDA_RELEASE_API_URL = "https://api.github.com/repos/frida/frida/releases/tags/{version}"
+
+# Location of a pushed Frida server binary on the device
+FRIDA_SERVER_PATH = "/data/local/tmp/frida-server-{version}-android-{architecture}"
+
+# Matches the "<serial>\t<state>" lines of `adb devices` output
+ADB_DEVICE_RE = re.compile(r"^(\S+)\t(\S+)", re.MULTILINE)
+
+# Separates the output of each command in a batched adb shell invocation
+ADB_BATCH_SEPARATOR = "===F4F_SEP==="
+
+# Lists Frida server PIDs by process name, so su/sh wrappers whose command lines mention it don't match
+FRIDA_PGREP_COMMAND = "pgrep frida-server"
+
+# How long to wait for a freshly started Frida server to listen, and how often to poll for it
+FRIDA_START_TIMEOUT = 3
+FRIDA_START_POLL_INTERVAL = 0.1
+
+# Map device ABIs (ro.product.cpu.abi) to the architecture names used by Frida releases
+ARCHITECTURE_MAP = {
+    "arm64-v8a": "arm64",
+    "arm64": "arm64",
+    "armeabi-v7a": "arm",
+    "armeabi": "arm",
+    "x86": "x86",
+    "x86_64": "x86_64",
+}
+
+# Function to run ADB shell commands and return their decoded stdout and stderr
+def adb_shell(*args, timeout=None):
+    result = subprocess.run(["adb", "shell", *args], stdout=subprocess.PIPE, stderr=subprocess.PIPE, timeout=timeout)
+    return result.stdout.decode('utf-8').strip(), result.stderr.decode('utf-8').strip()
+
+# Function to run several shell commands in one adb round-trip and return each command's (output, exit status)
+def adb_shell_batch(*commands):
+    stdout, _ = adb_shell("; ".join(f"{command}; echo {ADB_BATCH_SEPARATOR} $?" for command in commands))
+    chunks = stdout.split(ADB_BATCH_SEPARATOR)
+    results = []
+    output = chunks[0]
+    # Each separator line carries the exit status of the command before it
+    for chunk in chunks[1:]:
+        returncode, _, next_output = chunk.partition('\n')
+        results.append((output.strip(), int(returncode)))
+        output = next_output
+    # Pad for commands that never ran, e.g. when adb itself failed
+    return results + [("", None)] * (len(commands) - len(results))
 
 # Function to run ADB commands with SU privilege
 def adb_shell_su(command):
-    result = subprocess.run(f"adb shell su -c '{command}'", shell=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-    return result.stdout.decode('utf-8').strip(), result.stderr.decode('utf-8').strip()
+    return adb_shell("su", "-c", shlex.quote(command))
 
 # Function to check if a device is connected via ADB
 def check_device_connected():
     print(Fore.CYAN + "[*] Checking if a device is connected...")
     result = subprocess.run(["adb", "devices"], stdout=subprocess.PIPE)
-    devices = result.stdout.decode('utf-8').splitlines()
-    
-    if len(devices) <= 1:  # No device connected
+    devices = ADB_DEVICE_RE.findall(result.stdout.decode('utf-8'))
+
+    if not devices:  # No device connected
         print(Fore.RED + "[-] No device connected. Please connect a device and enable USB Debugging.")
         return False
 
-    for device in devices[1:]:
-        if "unauthorized" in device:
-            print(Fore.RED + "[-] Device connected, but ADB authorization is not granted. Please authorize the device.")
-            return False
-        elif "device" not in device:
-            print(Fore.RED + "[-] Device connected, but USB Debugging is not enabled. Please enable USB Debugging.")
-            return False
-        else:
-            print(Fore.GREEN + "[+] Device connected and authorized.")
-            return True
-
-    return False
+    _, state = devices[0]
+    if state == "unauthorized":
+        print(Fore.RED + "[-] Device connected, but ADB authorization is not granted. Please authorize the device.")
+        return False
+    elif state != "device":
+        print(Fore.RED + "[-] Device connected, but USB Debugging is not enabled. Please enable USB Debugging.")
+        return False
+    else:
+        print(Fore.GREEN + "[+] Device connected and authorized.")
+        return True
 
 # Function to check if the device is rooted using ADB
 def check_root():
     print(Fore.CYAN + "[*] Checking if the device is rooted...")
     try:
-        result = subprocess.run(["adb", "shell", "su", "-c", "id"], stdout=subprocess.PIPE, stderr=subprocess.PIPE, timeout=10)
-        stdout = result.stdout.decode('utf-8').strip()
+        stdout, _ = adb_shell("su", "-c", "id", timeout=10)
         if "uid=0(root)" in stdout:
             print(Fore.GREEN + "[+] Root access confirmed!")
             return True
@@ -66,21 +108,20 @@ def check_root():
         print(Fore.RED + "[-] Root check timed out. Ensure that the device is connected and ADB is enabled.")
         return False
 
+# Function to query whether the Frida port is listening and the server PIDs in a single adb round-trip
+def query_frida_server():
+    (_, port_returncode), (pid_output, _) = adb_shell_batch(f"netstat -tuln | grep {FRIDA_PORT}", FRIDA_PGREP_COMMAND)
+    return port_returncode == 0, pid_output.split()
+
 # Function to check if Frida is running on the default port and get its PIDs
 def check_frida_running_on_port():
     print(Fore.CYAN + "[*] Checking if Frida is running on the default port...")
     try:
-        result = subprocess.run(["adb", "shell", f"netstat -tuln | grep {FRIDA_PORT}"], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-        output = result.stdout.decode('utf-8').strip()
+        listening, pids = query_frida_server()
 
-        if output:
+        if listening:
             print(Fore.GREEN + f"[+] Frida server is running on port {FRIDA_PORT}.")
-            pid_result = subprocess.run(["adb", "shell", f"ps -Af | grep frida-server"], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-            pid_output = pid_result.stdout.decode('utf-8').strip()
-            
-            if pid_output:
-                # Extract PIDs from the output
-                pids = [line.split()[1] for line in pid_output.splitlines() if "frida-server" in line]
+            if pids:
                 print(Fore.GREEN + f"[+] Found Frida server PIDs: {', '.join(pids)}")
                 return pids
             else:
@@ -93,26 +134,21 @@ def check_frida_running_on_port():
         print(Fore.RED + f"[-] Error checking Frida server port: {e}")
         return None
 
-# Function to detect device architecture using adb
-def get_device_architecture():
+# Function to detect device architecture using adb (optionally from an already submitted getprop probe)
+def get_device_architecture(abi_future=None):
     print(Fore.CYAN + "[*] Detecting device architecture...")
     try:
         # Get the architecture from the device's properties
-        result = subprocess.run(["adb", "shell", "getprop", "ro.product.cpu.abi"], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-        arch = result.stdout.decode('utf-8').strip()
+        if abi_future is not None:
+            arch, _ = abi_future.result()
+        else:
+            arch, _ = adb_shell("getprop", "ro.product.cpu.abi")
 
         # Map the architecture from the device to the format required for Frida
-        if arch in ["arm64-v8a", "arm64"]:
-            return "arm64"
-        elif arch in ["armeabi-v7a", "armeabi"]:
-            return "arm"
-        elif arch == "x86":
-            return "x86"
-        elif arch == "x86_64":
-            return "x86_64"
-        else:
+        frida_arch = ARCHITECTURE_MAP.get(arch)
+        if frida_arch is None:
             print(Fore.RED + f"[-] Unknown architecture: {arch}")
-            return None
+        return frida_arch
     except subprocess.CalledProcessError as e:
         print(Fore.RED + f"[-] Failed to detect architecture: {e}")
         return None
@@ -135,102 +171,154 @@ def stop_all_frida_servers(pids):
             su_session.terminate()
             return
 
-        # Step 2: Execute the kill command for each PID within the same session
-        for pid in pids:
-            print(Fore.CYAN + f"[*] Stopping Frida server with PID {pid}...")
-            su_session.stdin.write(f"kill -9 {pid}\n")
-            su_session.stdin.flush()
-        
+        # Step 2: Kill every PID with a single command within the same session
+        print(Fore.CYAN + f"[*] Stopping Frida server PIDs {', '.join(pids)}...")
+        su_session.stdin.write(f"kill -9 {' '.join(pids)}\n")
+
+        # Wait (up to ~1s) until none of the PIDs exist anymore, so port 27042 is free when this returns,
+        # then report any survivors
+        su_session.stdin.write(
+            f"i=0; while [ $i -lt 40 ]; do alive=; for p in {' '.join(pids)}; do kill -0 $p 2>/dev/null && alive=\"$alive $p\"; done; "
+            "[ -z \"$alive\" ] && break; sleep 0.025; i=$((i+1)); done; echo \"alive:$alive\"\n"
+        )
+        su_session.stdin.flush()
+        survivors = su_session.stdout.readline().strip().partition("alive:")[2].split()
+
         su_session.stdin.write("exit\n")  # Close the SU session properly
         su_session.stdin.flush()
         su_session.wait()
 
-        print(Fore.GREEN + "[+] All Frida server processes stopped successfully.")
+        if survivors:
+            print(Fore.YELLOW + f"[!] Frida server PIDs still running after kill: {', '.join(survivors)}")
+        else:
+            print(Fore.GREEN + "[+] All Frida server processes stopped successfully.")
 
     except Exception as e:
         print(Fore.RED + f"[-] Error stopping Frida servers: {e}")
 
+# Function to look up the SHA256 digest GitHub publishes for a Frida release asset (None if unavailable)
+def get_published_sha256(version, asset_name):
+    import requests
+
+    try:
+        response = requests.get(FRIDA_RELEASE_API_URL.format(version=version), timeout=10)
+        response.raise_for_status()
+        assets = response.json().get("assets", [])
+    except (requests.exceptions.RequestException, ValueError):
+        return None
+
+    for asset in assets:
+        if asset.get("name") == asset_name:
+            algorithm, _, digest = (asset.get("digest") or "").partition(":")
+            return digest.lower() if algorithm == "sha256" and digest else None
+    return None
+
 # Function to download and install the Frida server on the device
 def download_and_install_frida_server(version, architecture):
+    # Imported here so runs that never download don't pay for loading requests/tqdm
+    import requests
+    from tqdm import tqdm
+
     print(Fore.CYAN + f"[*] Downloading and installing Frida server version {version} for {architecture}...")
-    url = f"https://github.com/frida/frida/releases/download/{version}/frida-server-{version}-android-{architecture}.xz"
-    local_filename = f"frida-server-{version}-android-{architecture}.xz"
+    asset_name = f"frida-server-{version}-android-{architecture}.xz"
+    url = f"https://github.com/frida/frida/releases/download/{version}/{asset_name}"
+    local_filename = f"frida-server-{version}-android-{architecture}"
+    # Stream into a temporary name so an interrupted download never looks like a finished binary
+    part_filename = local_filename + ".part"
+    frida_server_path = FRIDA_SERVER_PATH.format(version=version, architecture=architecture)
 
     try:
         with requests.get(url, stream=True) as r:
             r.raise_for_status()
             total_size = int(r.headers.get('content-length', 0))
-            block_size = 1024
+            block_size = 1024 * 1024
             t = tqdm(total=total_size, unit='iB', unit_scale=True)
-            with open(local_filename, 'wb') as f:
+            # Decompress while downloading so the .xz archive never has to be written and re-read
+            decompressor = lzma.LZMADecompressor()
+            # Hash the archive as it streams in rather than re-reading it afterwards
+            sha256 = hashlib.sha256()
+            with open(part_filename, 'wb') as f:
                 for data in r.iter_content(block_size):
                     t.update(len(data))
-                    f.write(data)
+                    sha256.update(data)
+                    if not decompressor.eof:
+                        f.write(decompressor.decompress(data))
             t.close()
 
-        print(Fore.CYAN + f"[*] Extracting Frida server {version}...")
-        subprocess.run(['xz', '--decompress', '-f', local_filename])
-        
+        if not decompressor.eof:
+            print(Fore.RED + "[-] Failed to download frida-server: archive is truncated.")
+            return None
+
+        # Verify the archive against the digest published for the release asset before installing it
+        digest = sha256.hexdigest()
+        published_digest = get_published_sha256(version, asset_name)
+        if published_digest is None:
+            print(Fore.YELLOW + f"[!] No published SHA256 digest found for {asset_name}; skipping integrity check.")
+        elif digest != published_digest:
+            print(Fore.RED + f"[-] SHA256 mismatch for {asset_name}: got {digest}, expected {published_digest}. Not installing.")
+            return None
+        else:
+            print(Fore.GREEN + "[+] SHA256 matches the published release digest.")
+        os.replace(part_filename, local_filename)
+
         # Push to the device and set permissions
-        extracted_file = local_filename.rstrip(".xz")
-        subprocess.run(["adb", "push", extracted_file, f"/data/local/tmp/frida-server-{version}-android-{architecture}"])
-        subprocess.run(["adb", "shell", "chmod", "755", f"/data/local/tmp/frida-server-{version}-android-{architecture}"])
+        subprocess.run(["adb", "push", local_filename, frida_server_path])
+        adb_shell("chmod", "755", frida_server_path)
         print(Fore.GREEN + f"[+] Frida server {version} installed on the device.")
-        return f"/data/local/tmp/frida-server-{version}-android-{architecture}"
+        return frida_server_path
 
-    except requests.exceptions.HTTPError as err:
+    except requests.exceptions.RequestException as err:
         print(Fore.RED + f"[-] Failed to download frida-server: {err}")
         return None
+    except lzma.LZMAError as err:
+        print(Fore.RED + f"[-] Failed to download frida-server: invalid xz archive ({err})")
+        return None
+    finally:
+        # Only a complete, verified download is renamed away from the temporary name
+        if os.path.exists(part_filename):
+            os.remove(part_filename)
 
 # Function to run Frida server using nohup and check if it's running
 def run_frida_server(frida_server_path):
     print(Fore.CYAN + f"[*] Starting Frida server at {frida_server_path}...")
 
     try:
-        # Start Frida server in the background using nohup
-        start_command = f"adb shell nohup su -c '{frida_server_path}' >/dev/null 2>&1 &"
-        result = subprocess.run(start_command, shell=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
-
-        # Capture any stdout or stderr messages for diagnostics
-        stdout = result.stdout.strip()
-        stderr = result.stderr.strip()
-
-        if stdout:
-            print(Fore.CYAN + f"[*] Frida server stdout: {stdout}")
-        if stderr:
-            print(Fore.RED + f"[-] Frida server stderr: {stderr}")
+        # Start Frida server in the background using nohup; adb runs in its own session so
+        # Ctrl+C in this script doesn't reach it and take the server down
+        subprocess.Popen(["adb", "shell", "nohup", "su", "-c", shlex.quote(frida_server_path)],
+                         stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+                         start_new_session=True)
 
-        # Wait for a few seconds to check if Frida starts successfully
-        time.sleep(3)
-
-        # Check if Frida server is running by looking for its process
+        # Poll until the server listens on its port rather than sleeping for a fixed time
         print(Fore.CYAN + "[*] Checking if Frida server is running...")
-        check_command = "adb shell ps | grep frida-server"
-        check_result = subprocess.run(check_command, shell=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
-
-        if check_result.returncode == 0 and "frida-server" in check_result.stdout:
-            # Extract the PID
-            pid_line = check_result.stdout.strip().splitlines()[0]
-            pid = pid_line.split()[1]  # Assuming the PID is the second column
+        deadline = time.monotonic() + FRIDA_START_TIMEOUT
+        listening, pids = query_frida_server()
+        while not listening and time.monotonic() < deadline:
+            time.sleep(FRIDA_START_POLL_INTERVAL)
+            listening, pids = query_frida_server()
+
+        if listening and pids:
+            pid = pids[0]
             print(Fore.GREEN + f"[+] Frida server started successfully with PID: {pid}.")
         else:
-            print(Fore.RED + "[-] Failed to start Frida server. No running process detected.")
+            if pids:
+                print(Fore.RED + f"[-] Failed to start Frida server. Not listening on port {FRIDA_PORT} after {FRIDA_START_TIMEOUT}s.")
+            else:
+                print(Fore.RED + "[-] Failed to start Frida server. No running process detected.")
             # Check device logs for Frida-related issues
-            log_result = subprocess.run("adb logcat | grep frida", shell=True, stdout=subprocess.PIPE, text=True)
+            log_output, _ = adb_shell("logcat -d | grep frida")
             print(Fore.RED + "[-] Frida log output:")
-            print(log_result.stdout)
+            print(log_output)
 
     except Exception as e:
         print(Fore.RED + f"[-] Error starting Frida server: {e}")
 
 # Function to check if a Frida server is installed on the device
 def check_frida_server_installed(version, architecture):
-    frida_server_path = f"/data/local/tmp/frida-server-{version}-android-{architecture}"
+    frida_server_path = FRIDA_SERVER_PATH.format(version=version, architecture=architecture)
     print(Fore.CYAN + f"[*] Checking if Frida server is installed at {frida_server_path}...")
     
-    result = subprocess.run(["adb", "shell", "ls", frida_server_path], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-    stdout = result.stdout.decode('utf-8').strip()
-    stderr = result.stderr.decode('utf-8').strip()
+    stdout, stderr = adb_shell("ls", frida_server_path)
     
     if "No such file" in stderr:
         print(Fore.RED + f"[-] Frida server binary not found at {frida_server_path}.")
@@ -247,11 +335,14 @@ def main():
     if not check_root():
         return
 
-    # Check if Frida server is running on the default port and get its PIDs
-    frida_pids = check_frida_running_on_port()
-    
-    # Detect architecture
-    architecture = get_device_architecture()
+    # Query the device ABI in the background while checking if Frida server is
+    # running on the default port; only the adb call runs off the main thread,
+    # so all output stays in order
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        abi_future = executor.submit(adb_shell, "getprop", "ro.product.cpu.abi")
+        frida_pids = check_frida_running_on_port()
+        architecture = get_device_architecture(abi_future)
+
     if not architecture:
         print(Fore.RED + "[-] Could not detect device architecture. Exiting.")
         return
@@ -271,7 +362,10 @@ def main():
             return
 
     # Prompt for Frida version and check if the server is installed on the device
-    desired_version = input(Fore.CYAN + "\nEnter the Frida version you want to use or install (e.g., 16.1.17): ")
+    desired_version = input(Fore.CYAN + "\nEnter the Frida version you want to use or install (e.g., 16.1.17): ").strip()
+    if not FRIDA_VERSION_RE.fullmatch(desired_version):
+        print(Fore.RED + f"[-] Invalid Frida version: {desired_version!r}. Expected a version such as 16.1.17.")
+        return
     frida_server_path = check_frida_server_installed(desired_version, architecture)
 
     if not frida_server_path: